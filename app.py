@@ -1,112 +1,200 @@
-from flask import Flask, render_template, request, send_from_directory
+from flask import Flask, abort, render_template, request, send_file
 from docx import Document
+from collections import OrderedDict
+from dataclasses import dataclass
+import concurrent.futures
+import functools
+import io
+import multiprocessing
 import os
 import re
+import threading
+import time
+import uuid
 
 app = Flask(__name__)
 
-def split_text_by_pattern(lines):
+# Generated documents are kept in memory, keyed by a per-request token, instead of
+# being written to static/. A conversion expires after MAX_STORED_AGE seconds, and the
+# oldest ones are dropped while all stored documents together exceed MAX_STORED_BYTES.
+# The store belongs to this process: with several server workers, a download only
+# works if it reaches the worker that ran the conversion.
+MAX_STORED_AGE = 60 * 60
+MAX_STORED_BYTES = 200 * 1024 * 1024
+generated_files = OrderedDict()  # token -> (stored_at, size, {filename: bytes})
+generated_files_size = 0
+generated_files_lock = threading.Lock()
+
+# Worker processes for converting several chunks at once. The pool is created on first
+# use and shared by all requests, so workers (and their template cache) are reused.
+conversion_executor = None
+conversion_executor_lock = threading.Lock()
+
+# Classifies every line of the input in one regex sweep: a ---FileName--- delimiter, an
+# option with or without labels (e.g., (A), [B], C), D. etc.), or otherwise question text.
+# Surrounding whitespace is left outside the groups and blank lines never match.
+# Each group ends on a non-space through a greedy .*, so a long run of whitespace is
+# backtracked over once per line instead of being re-scanned at every character.
+LINE_RE = re.compile(r'''
+    ^[^\S\n]*
+    (?:
+        (?P<file>(?=---).*(?<=---))
+      | (?P<opt>(?:[\(\[]?[A-Za-z0-9][\)\]]|[A-Da-d]\.)(?:.*\S)?)
+      | (?P<q>\S(?:.*\S)?)
+    )
+    [^\S\n]*$
+''', re.MULTILINE | re.VERBOSE)
+
+# Parts of an option line matched by LINE_RE: label, a leading or trailing "@" that
+# marks the correct answer, and the rest of the line (see parse_option)
+OPTION_CAPTURE = re.compile(r'^(?:[\(\[]?([A-Za-z0-9])[\)\]]|([A-Da-d])\.)\s*(@?)(.*)$')
+
+# Question type written into every question table
+QUESTION_TYPE = 'multiple_choice'
+
+# Question numbers like "Q.1", "Q1.", "1.", "Q1)" etc.
+QNUM_RE = re.compile(r'^(Q\.?\d+\.?|\d+\.?|\d+\))\s*')
+
+def parse_option(line):
     """
-    Splits the input lines into chunks based on delimiters in the format ---FileName---.
-    Extracts the filename from the delimiter and associates it with the corresponding text block.
+    Splits an option line into its label, its text and whether a leading or trailing "@"
+    marks it as the correct answer.
     """
-    results = []
-    current_chunk = []
-    current_filename = None
-
-    for line in lines:
-        stripped_line = line.strip()
-        # Check if the line starts and ends with '---', indicating a new file
-        if stripped_line.startswith('---') and stripped_line.endswith('---'):
-            # Save the current chunk if it's not empty
-            if current_chunk:
-                results.append((current_filename, current_chunk))
-                current_chunk = []
-            # Extract filename from the delimiter
-            current_filename = stripped_line.strip('-')
-        else:
-            # Add line to the current chunk
-            current_chunk.append(stripped_line)
-    
-    # Add the last chunk if it exists
-    if current_chunk:
-        results.append((current_filename, current_chunk))
-    
-    return results
-
-def preprocess_mcq_lines(lines):
+    option_match = OPTION_CAPTURE.match(line)
+    # The trailing "@" is sliced off here: matching it in the regex after a lazy text group
+    # made the surrounding \s* re-scan long whitespace runs at every character
+    text = option_match.group(4).strip()
+    marked_at_end = text.endswith('@')
+    if marked_at_end:
+        text = text[:-1].rstrip()
+    label = option_match.group(1) or option_match.group(2)
+    return label, text, bool(option_match.group(3)) or marked_at_end
+
+def parse_mcq_text(text):
     """
-    Preprocesses the input lines to handle questions and options.
+    Splits the input text into chunks based on delimiters in the format ---FileName---
+    and, in the same pass, preprocesses each chunk to handle questions and options.
+    Returns a list of (filename, entries) pairs, where entries is a list of (tag, text)
+    tuples with tag 'Q' for a question block and 'O' for an option line.
     """
-    processed_lines = []
+    results = []
+    entries = []
+    current_filename = None
     current_question = []
     in_options = False
 
-    for line in lines:
-        stripped_line = line.strip()
-        if not stripped_line:  # Skip empty lines
-            continue
+    for match in LINE_RE.finditer(text):
+        kind = match.lastgroup
+        stripped_line = match.group(kind)
 
-        # Detect options with or without labels (e.g., (A), (B), A., B. etc.)
-        option_match = re.match(r'^[\(\[]?[A-Za-z0-9][\)\]].*|^[A-Da-d]\..*', stripped_line)
+        # A line that starts and ends with '---' indicates a new file
+        if kind == 'file':
+            if current_question:  # Close the last question of the current chunk
+                entries.append(('Q', "\n".join(current_question)))
+                current_question = []
+            # Save the current chunk if it's not empty
+            if entries:
+                results.append((current_filename, entries))
+                entries = []
+            in_options = False
+            # Extract filename from the delimiter
+            current_filename = stripped_line.strip('-')
 
-        if option_match:
+        elif kind == 'opt':
             if current_question and not in_options:  # Save previous question block
-                processed_lines.append("\n".join(current_question).strip())
+                entries.append(('Q', "\n".join(current_question)))
                 current_question = []
-            processed_lines.append(stripped_line)
+            entries.append(('O', stripped_line))
             in_options = True
         else:
-            # If the line does not match option patterns, consider it part of the question
+            # If the line does not match option patterns, consider it part of the question.
+            # Groups exclude surrounding whitespace, so the joined block needs no strip().
             current_question.append(stripped_line)
             in_options = False
 
     if current_question:  # Add the last question if any
-        processed_lines.append("\n".join(current_question).strip())
+        entries.append(('Q', "\n".join(current_question)))
 
-    return processed_lines
+    # Add the last chunk if it exists
+    if entries:
+        results.append((current_filename, entries))
 
-def convert_text_to_word(lines, template_file):
+    return results
+
+@functools.lru_cache(maxsize=8)
+def read_template_bytes(template_file):
     """
-    Converts processed MCQ lines into a Word document format using a template file.
+    Reads the raw bytes of a template file once; later conversions reuse the cached copy.
     """
-    doc = Document(template_file)
-    table_index = 0
-    line_index = 0
-    incorrect_options_lines = []
-
-    lines = preprocess_mcq_lines(lines)
+    with open(template_file, 'rb') as f:
+        return f.read()
 
-    # Regex pattern to match question numbers like "Q.1", "Q1.", "1.", "Q1)" etc.
-    question_number_pattern = re.compile(r'^(Q\.?\d+\.?|\d+\.?|\d+\))\s*')
+@dataclass(slots=True)
+class ParsedQ:
+    """
+    A parsed question: its text, option texts and the 0-based index of the correct option.
+    """
+    question: str
+    options: tuple[str, ...]
+    correct: int | None
 
-    while table_index < len(doc.tables) and line_index < len(lines):
-        # Skip empty lines
-        while line_index < len(lines) and not lines[line_index].strip():
-            line_index += 1
+def populate_table(table, parsed):
+    """
+    Writes a parsed question, its options and the correct answer number into a template table.
+    """
+    # table.cell() rebuilds the whole cell grid on every call, so build it once per table.
+    # This relies on python-docx's private Table._cells and Table._column_count, which
+    # table.cell() itself uses to locate a cell.
+    cells = table._cells
+    column_count = table._column_count
+
+    # Assign options to variables
+    option1, option2, option3, option4 = (parsed.options + ('',) * 4)[:4]
+
+    # Place the correct answer index (1-based) in the answer row
+    correct_option_index = str(parsed.correct + 1) if parsed.correct is not None else ''
+
+    cell_values = (
+        ((0, 1), parsed.question),
+        ((1, 1), QUESTION_TYPE),
+        ((2, 0), 'Option'),
+        ((2, 1), option1),  # Option 1
+        ((3, 0), option2),  # Option 2
+        ((3, 2), option3),  # Option 3
+        ((4, 1), option4),  # Option 4
+        ((4, 3), correct_option_index),
+    )
+    for (row, col), text in cell_values:
+        cells[row * column_count + col].text = text
+
+def parse_questions(lines, max_questions):
+    """
+    Groups tagged MCQ lines (see parse_mcq_text) into at most `max_questions` questions.
+    Returns a list of ParsedQ and the line numbers of questions without a marked correct option.
+    """
+    questions = []
+    line_index = 0
+    incorrect_options_lines = []
 
+    # Post-preprocess invariant: no empty lines, and every line is already stripped
+    while len(questions) < max_questions and line_index < len(lines):
         # Collect question lines
         question_lines = []
-        while line_index < len(lines) and lines[line_index].strip() and not re.match(r'^[\(\[]?[A-Za-z0-9][\)\]].*|^[A-Da-d]\..*', lines[line_index]):
+        while line_index < len(lines) and lines[line_index][0] == 'Q':
             # Remove question number (e.g., "Q.1", "1.", "Q1)")
-            cleaned_line = re.sub(question_number_pattern, '', lines[line_index].strip())
+            cleaned_line = QNUM_RE.sub('', lines[line_index][1])
             question_lines.append(cleaned_line)
             line_index += 1
 
-        question = "\n".join(question_lines).strip()
-
-        # Skip empty lines between question and options
-        while line_index < len(lines) and not lines[line_index].strip():
-            line_index += 1
+        question = "\n".join(question_lines)
 
         # Collect options and identify the correct answer
         options = []
         correct_index = None
-        while line_index < len(lines) and lines[line_index].strip() and re.match(r'^[\(\[]?[A-Za-z0-9][\)\]].*|^[A-Da-d]\..*', lines[line_index]):
-            option_line = lines[line_index].strip()
-            option = option_line.split(')', 1)[-1].strip()  # Get text after label
-            options.append(option)
-            if '@' in option_line:  # Identify correct answer
+        while line_index < len(lines) and lines[line_index][0] == 'O':
+            _, option, is_correct = parse_option(lines[line_index][1])
+            options.append(option)  # Text after label, without the marker
+            if is_correct:  # Identify correct answer
                 correct_index = len(options) - 1
             line_index += 1
 
@@ -114,49 +202,186 @@ def convert_text_to_word(lines, template_file):
         if correct_index is None:
             incorrect_options_lines.append(line_index - len(options))
 
-        # Insert data into the current table
-        table = doc.tables[table_index]
-        table.cell(0, 1).text = question
-        table.cell(1, 1).text = 'multiple_choice'
-
-        # Assign options to variables
-        option1 = options[0] if len(options) > 0 else ''
-        option2 = options[1] if len(options) > 1 else ''
-        option3 = options[2] if len(options) > 2 else ''
-        option4 = options[3] if len(options) > 3 else ''
-
-        # Place the options in the correct format
-        table.cell(2, 0).text = 'Option'  
-        table.cell(2, 1).text = f'{option1}'  # Option 1
-        table.cell(3, 0).text = f'{option2}'  # Option 2
-        table.cell(3, 2).text = f'{option3}'  # Option 3
-        table.cell(4, 1).text = f'{option4}'  # Option 4
-
-        # Place the correct answer index (1-based) in the answer row
-        if correct_index is not None:
-            # Since options are 0-indexed in Python, add 1 to get a 1-based index
-            correct_option_index = correct_index + 1
-            table.cell(4, 3).text = str(correct_option_index)
-        else:
-            table.cell(4, 3).text = ''
+        questions.append(ParsedQ(question, tuple(options), correct_index))
+
+    return questions, incorrect_options_lines
 
-        # Move to the next table for the next question set
-        table_index += 1
+def convert_text_to_word(lines, template_file):
+    """
+    Converts tagged MCQ lines (see parse_mcq_text) into a Word document format using a template file.
+    """
+    doc = Document(io.BytesIO(read_template_bytes(template_file)))
+
+    # doc.tables rebuilds its list from the document body on every access
+    tables = doc.tables
+    questions, incorrect_options_lines = parse_questions(lines, len(tables))
+
+    # Insert each question set into its own table
+    for table, parsed in zip(tables, questions):
+        populate_table(table, parsed)
 
     return doc, incorrect_options_lines
 
+def process_input(text_files):
+    """
+    Reads the uploaded text files and returns a list of (filename, text) pairs.
+    Raises ValueError when an upload is not UTF-8 text.
+    """
+    uploaded_texts = []
+    for text_file in text_files:
+        if not text_file.filename:  # Skip the empty part sent when no file is chosen
+            continue
+        try:
+            text = text_file.read().decode('utf-8-sig')
+        except UnicodeDecodeError as e:
+            raise ValueError(f"Could not read {text_file.filename}: the file is not UTF-8 text") from e
+        # Turn '\r\n' and '\r' line endings into the '\n' that LINE_RE splits on
+        text = text.replace('\r\n', '\n').replace('\r', '\n')
+        uploaded_texts.append((text_file.filename, text))
+    return uploaded_texts
+
+def convert_chunk(job):
+    """
+    Converts a single chunk and returns the saved document as bytes.
+    Kept at module level so it can run in a worker process.
+    """
+    chunk, template_file_path = job
+    doc, incorrect_options_lines = convert_text_to_word(chunk, template_file_path)
+    output = io.BytesIO()
+    doc.save(output)
+    return output.getvalue()
+
+def make_output_file_names(file_chunks):
+    """
+    Returns one unique .docx name per chunk. Chunk names are kept as written, except that
+    "/" (which cannot appear in a download URL segment) becomes "_", and a repeated name
+    gets a " (2)", " (3)", ... suffix.
+    """
+    output_file_names = []
+    used_names = set()
+    for i, (filename, _) in enumerate(file_chunks):
+        # Use specified filename or default
+        base_name = (filename or '').replace('/', '_') or f'output_{i + 1}'
+        output_file_name = f"{base_name}.docx"
+        copy_number = 2
+        while output_file_name in used_names:
+            output_file_name = f"{base_name} ({copy_number}).docx"
+            copy_number += 1
+        used_names.add(output_file_name)
+        output_file_names.append(output_file_name)
+    return output_file_names
+
+def get_conversion_executor():
+    """
+    Returns the shared worker pool, creating it on first use.
+    """
+    global conversion_executor
+    with conversion_executor_lock:
+        if conversion_executor is None:
+            # Spawned workers do not inherit the web server's threads and locks
+            conversion_executor = concurrent.futures.ProcessPoolExecutor(
+                max_workers=os.cpu_count() or 1,
+                mp_context=multiprocessing.get_context('spawn'),
+            )
+        return conversion_executor
+
+def discard_conversion_executor(executor):
+    """
+    Drops a broken worker pool so the next request starts a fresh one.
+    """
+    global conversion_executor
+    with conversion_executor_lock:
+        if conversion_executor is executor:
+            conversion_executor = None
+    executor.shutdown(wait=False, cancel_futures=True)
+
+def handle_conversion(file_chunks, template_file_path):
+    """
+    Converts every (filename, chunk) pair into its own Word document.
+    Returns a dict mapping each output file name to the document bytes.
+    Several chunks are converted in parallel on the shared worker pool.
+    """
+    output_file_names = make_output_file_names(file_chunks)
+    jobs = [(chunk, template_file_path) for _, chunk in file_chunks]
+
+    output_files = {}
+    if len(jobs) > 1:
+        executor = get_conversion_executor()
+        pending = [executor.submit(convert_chunk, job) for job in jobs]
+        for i, (output_file_name, future) in enumerate(zip(output_file_names, pending)):
+            try:
+                output_files[output_file_name] = future.result()
+            except Exception as e:
+                for other in pending:
+                    other.cancel()
+                if isinstance(e, concurrent.futures.process.BrokenProcessPool):
+                    discard_conversion_executor(executor)
+                raise ValueError(f"Error processing chunk {i + 1}: {str(e)}") from e
+    else:
+        # A single chunk is not worth a round trip to a worker process
+        for i, (output_file_name, job) in enumerate(zip(output_file_names, jobs)):
+            try:
+                output_files[output_file_name] = convert_chunk(job)
+            except Exception as e:
+                raise ValueError(f"Error processing chunk {i + 1}: {str(e)}") from e
+
+    return output_files
+
+def prune_generated_files(now):
+    """
+    Drops expired conversions, then the oldest ones while the store is over its size cap.
+    The newest conversion is kept until it expires, even if it alone exceeds the cap.
+    Must be called with generated_files_lock held.
+    """
+    global generated_files_size
+    while generated_files:
+        token, (stored_at, size, _) = next(iter(generated_files.items()))
+        expired = now - stored_at > MAX_STORED_AGE
+        over_size = generated_files_size > MAX_STORED_BYTES and len(generated_files) > 1
+        if not (expired or over_size):
+            break
+        del generated_files[token]
+        generated_files_size -= size
+
+def store_output_files(output_files):
+    """
+    Keeps the generated documents in memory and returns the token used to download them.
+    """
+    global generated_files_size
+    token = uuid.uuid4().hex
+    size = sum(len(data) for data in output_files.values())
+    with generated_files_lock:
+        now = time.monotonic()
+        generated_files[token] = (now, size, output_files)
+        generated_files_size += size
+        prune_generated_files(now)
+    return token
+
 @app.route('/', methods=['GET', 'POST'])
 def index():
     """
     Handles the main index route for displaying the form and processing MCQ input.
     """
     if request.method == 'POST':
-        # Get the text content or uploaded files
+        # Get the uploaded files, or the text content when nothing was uploaded. The editor
+        # can still hold earlier text alongside an upload, so it is ignored in that case.
+        try:
+            uploaded_texts = process_input(request.files.getlist('text_files'))
+        except ValueError as e:
+            return render_template('index.html', error=str(e))
         text_content = request.form['text_content']
-        lines = text_content.split('\n') if text_content else []
 
-        # Split lines into chunks with filenames
-        file_chunks = split_text_by_pattern(lines)
+        file_chunks = []
+        if uploaded_texts:
+            # Each uploaded file is split into chunks, defaulting to its own name
+            for upload_name, file_text in uploaded_texts:
+                default_name = os.path.splitext(upload_name)[0]
+                for filename, chunk in parse_mcq_text(file_text):
+                    file_chunks.append((filename or default_name, chunk))
+        elif text_content:
+            # Split the text into chunks with filenames; the '\r' of browser CRLF line
+            # endings is trailing whitespace to LINE_RE
+            file_chunks = parse_mcq_text(text_content)
 
         # Template selection
         template_size = request.form['template_size']
@@ -166,21 +391,14 @@ def index():
             return render_template('index.html', error="Invalid template size selected")
 
         # Process each chunk and generate files
-        file_names = []
-        for i, (filename, chunk) in enumerate(file_chunks):
-            try:
-                doc, incorrect_options_lines = convert_text_to_word(chunk, template_file_path)
-
-                # Use specified filename or default
-                output_file_name = f"{filename or f'output_{i + 1}'}.docx"
-                output_file_path = f"static/{output_file_name}"
-                doc.save(output_file_path)
-                file_names.append(output_file_name)
-            except Exception as e:
-                return render_template('index.html', error=f"Error processing chunk {i + 1}: {str(e)}")
+        try:
+            output_files = handle_conversion(file_chunks, template_file_path)
+        except ValueError as e:
+            return render_template('index.html', error=str(e))
+        token = store_output_files(output_files)
 
         # Return results
-        return render_template('result.html', file_names=file_names)
+        return render_template('result.html', token=token, file_names=list(output_files))
 
     return render_template('index.html')
 
@@ -198,12 +416,19 @@ def get_template_path(template_size):
     }
     return template_files.get(template_size)
 
-@app.route('/download/<filename>', methods=['GET'])
-def download(filename):
+@app.route('/download/<token>/<filename>', methods=['GET'])
+def download(token, filename):
     """
     Allows users to download the generated Word document.
     """
-    return send_from_directory(os.path.join(os.getcwd(), 'static'), filename, as_attachment=True)
+    with generated_files_lock:
+        prune_generated_files(time.monotonic())
+        stored = generated_files.get(token)
+        data = stored[2].get(filename) if stored else None
+    if data is None:
+        abort(404)
+    return send_file(io.BytesIO(data), as_attachment=True, download_name=filename,
+                     mimetype='application/vnd.openxmlformats-officedocument.wordprocessingml.document')
 
 if __name__ == '__main__':
     app.run(debug=True)
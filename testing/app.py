@@ -2,12 +2,51 @@ from flask import Flask, render_template, request, send_from_directory
 from docx import Document
 import os
 import re
+import string
 
 app = Flask(__name__)
 
+# Characters allowed as an option label (e.g., the "A" in "(A)")
+OPTION_LABEL_CHARS = frozenset(string.ascii_letters + string.digits)
+
+# Parts of an option line accepted by is_option(): label, a leading or trailing "@" that
+# marks the correct answer, and the rest of the line (see parse_option)
+OPTION_CAPTURE = re.compile(r'^(?:[\(\[]?([A-Za-z0-9])[\)\]]|([A-Da-d])\.)\s*(@?)(.*)$')
+
+def is_option(line):
+    """
+    Checks whether a stripped, non-empty line is an option with or without labels
+    (e.g., (A), [B], C), D. etc.).
+    """
+    if len(line) < 2:
+        return False
+    first = line[0]
+    if first in '([':
+        return len(line) > 2 and line[1] in OPTION_LABEL_CHARS and line[2] in ')]'
+    if line[1] in ')]':
+        return first in OPTION_LABEL_CHARS
+    return line[1] == '.' and first in 'ABCDabcd'
+
+def parse_option(line):
+    """
+    Splits an option line into its label, its text and whether a leading or trailing "@"
+    marks it as the correct answer.
+    """
+    option_match = OPTION_CAPTURE.match(line)
+    # The trailing "@" is sliced off here: matching it in the regex after a lazy text group
+    # made the surrounding \s* re-scan long whitespace runs at every character
+    text = option_match.group(4).strip()
+    marked_at_end = text.endswith('@')
+    if marked_at_end:
+        text = text[:-1].rstrip()
+    label = option_match.group(1) or option_match.group(2)
+    return label, text, bool(option_match.group(3)) or marked_at_end
+
 def preprocess_mcq_lines(lines):
     """
     Preprocesses the input lines to handle questions and options.
+    Returns a list of (tag, text) tuples where tag is 'Q' for a question block
+    and 'O' for an option line.
     """
     processed_lines = []
     current_question = []
@@ -19,21 +58,22 @@ def preprocess_mcq_lines(lines):
             continue
 
         # Detect options with or without labels (e.g., (A), (B), A., B. etc.)
-        option_match = re.match(r'^[\(\[]?[A-Za-z0-9][\)\]].*|^[A-Da-d]\..*', stripped_line)
+        option_match = is_option(stripped_line)
 
         if option_match:
             if current_question and not in_options:  # Save previous question block
-                processed_lines.append("\n".join(current_question).strip())
+                processed_lines.append(('Q', "\n".join(current_question)))
                 current_question = []
-            processed_lines.append(stripped_line)
+            processed_lines.append(('O', stripped_line))
             in_options = True
         else:
-            # If the line does not match option patterns, consider it part of the question
+            # If the line does not match option patterns, consider it part of the question.
+            # Lines are stored stripped, so the joined block needs no further strip().
             current_question.append(stripped_line)
             in_options = False
 
     if current_question:  # Add the last question if any
-        processed_lines.append("\n".join(current_question).strip())
+        processed_lines.append(('Q', "\n".join(current_question)))
 
     return processed_lines
 
@@ -46,46 +86,37 @@ def convert_text_to_word(lines, template_file):
     line_index = 0
     incorrect_options_lines = []
 
-    lines = preprocess_mcq_lines(lines)
+    # doc.tables rebuilds its list from the document body on every access
+    tables = doc.tables
 
-    while table_index < len(doc.tables) and line_index < len(lines):
-        # Skip empty lines
-        while line_index < len(lines) and not lines[line_index].strip():
-            line_index += 1
+    lines = preprocess_mcq_lines(lines)
 
+    # Post-preprocess invariant: no empty lines, and every line is already stripped
+    while table_index < len(tables) and line_index < len(lines):
         # Collect question lines
         question_lines = []
-        while line_index < len(lines) and lines[line_index].strip() and not re.match(r'^[\(\[]?[A-Za-z0-9][\)\]].*|^[A-Da-d]\..*', lines[line_index]):
-            question_lines.append(lines[line_index].strip())
+        while line_index < len(lines) and lines[line_index][0] == 'Q':
+            question_lines.append(lines[line_index][1])
             line_index += 1
 
-        question = "\n".join(question_lines).strip()
-
-        # Skip empty lines between question and options
-        while line_index < len(lines) and not lines[line_index].strip():
-            line_index += 1
+        question = "\n".join(question_lines)
 
         # Collect options and identify the correct answer
         options = []
         correct_index = None
         option_labels = ['A', 'B', 'C', 'D']  # Define the order of labels
-        while line_index < len(lines) and lines[line_index].strip() and re.match(r'^[\(\[]?[A-Za-z0-9][\)\]].*|^[A-Da-d]\..*', lines[line_index]):
-            option_line = lines[line_index].strip()
-            
-            # Extract the label and the option text
-            label_match = re.match(r'^([\(\[]?)([A-Da-d])[\)\]].*(?:@)?', option_line)
-            if label_match:
-                label = label_match.group(2).upper()
-                option_text = re.split(r'[\)\]].*', option_line, maxsplit=1)[-1].strip()
-            else:
-                label = f"{len(options)+1}"  # Fallback to number if label not found
-                option_text = option_line
+        while line_index < len(lines) and lines[line_index][0] == 'O':
+            # Extract the label, the option text and the correct-answer marker
+            label, text, is_correct = parse_option(lines[line_index][1])
+            label = label.upper()
+            if label not in option_labels:
+                label = f"{len(options)+1}"  # Fallback to number if label is not A-D
 
             # Check if this option is marked as correct
-            if '@' in option_line:
+            if is_correct:
                 correct_index = len(options)  # 0-based index
 
-            options.append((label, option_text))
+            options.append((label, text))
             line_index += 1
 
         # If no correct answer is found, add line number to incorrect_options_lines
@@ -93,15 +124,12 @@ def convert_text_to_word(lines, template_file):
             incorrect_options_lines.append(line_index - len(options))
 
         # Insert data into the current table
-        table = doc.tables[table_index]
+        table = tables[table_index]
         table.cell(0, 1).text = question
         table.cell(1, 1).text = 'multiple_choice'
 
         # Assign options to variables
-        option1 = options[0][1] if len(options) > 0 else ''
-        option2 = options[1][1] if len(options) > 1 else ''
-        option3 = options[2][1] if len(options) > 2 else ''
-        option4 = options[3][1] if len(options) > 3 else ''
+        option1, option2, option3, option4 = ([text for _, text in options] + [''] * 4)[:4]
         
         # Determine the correct answer number
         correct_number = (correct_index + 1) if correct_index is not None else ''
@@ -129,7 +157,7 @@ def index():
     if request.method == 'POST':
         text_content = request.form['text_content']
         template_size = request.form['template_size']
-        lines = text_content.split('\n')
+        lines = text_content.splitlines()
 
         template_file_path = get_template_path(template_size)
 
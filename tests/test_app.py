@@ -0,0 +1,26 @@
+import time
+import unittest
+
+from app import ParsedQ, parse_mcq_text, parse_questions
+
+
+class ParseMcqTextTest(unittest.TestCase):
+    def test_long_whitespace_run_parses_in_linear_time(self):
+        # A lazily matched group re-scans the whitespace run at every character, which
+        # took minutes at this size; a linear scan finishes in milliseconds.
+        spaces = ' ' * 100_000
+        text = f"Q1 a{spaces}b\n(A) x{spaces}y@\n{spaces}\n---name---{spaces}\n"
+
+        start = time.perf_counter()
+        chunks = parse_mcq_text(text)
+        questions, incorrect_options_lines = parse_questions(chunks[0][1], 25)
+        elapsed = time.perf_counter() - start
+
+        self.assertLess(elapsed, 1.0)
+        self.assertEqual(chunks, [(None, [('Q', f"Q1 a{spaces}b"), ('O', f"(A) x{spaces}y@")])])
+        self.assertEqual(questions, [ParsedQ(f"a{spaces}b", (f"x{spaces}y",), 0)])
+        self.assertEqual(incorrect_options_lines, [])
+
+
+if __name__ == '__main__':
+    unittest.main()